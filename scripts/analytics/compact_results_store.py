@@ -0,0 +1,73 @@
+"""
+Compaction for the Parquet results store.
+
+The Lambdas write one small file per document / Textract job. This merges the
+files of every partition into a single zstd Parquet file, keeping only the
+latest row per document_id / job_id, and deletes the merged inputs. Files
+written while it runs are left for the next run. Schedule it (e.g. daily) so
+reports read a few large files instead of thousands of small ones:
+
+    python scripts/analytics/compact_results_store.py s3://bucket/results_store/ --min-files 2
+"""
+import argparse
+import uuid
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+# dataset -> (row key, timestamp column used to keep the latest row)
+DATASETS = {
+    "documents": ("document_id", "processing_timestamp"),
+    "textract_jobs": ("job_id", "processed_at"),
+}
+
+
+def list_partitions(fs, dataset_root):
+    partitions = defaultdict(list)
+    selector = pafs.FileSelector(dataset_root, allow_not_found=True, recursive=True)
+    for info in fs.get_file_info(selector):
+        if info.type == pafs.FileType.File and info.path.endswith(".parquet"):
+            partitions[info.path.rsplit("/", 1)[0]].append(info.path)
+    return partitions
+
+
+def latest_rows(table, key, ts_column):
+    table = table.sort_by([(key, "ascending"), (ts_column, "descending")])
+    keys = table[key].to_pylist()
+    keep = [i for i, k in enumerate(keys) if i == 0 or k != keys[i - 1]]
+    return table.take(pa.array(keep, type=pa.int64()))
+
+
+def compact_partition(fs, partition, files, key, ts_column):
+    tables = [pq.read_table(path, filesystem=fs) for path in files]
+    table = latest_rows(pa.concat_tables(tables, promote_options="default"), key, ts_column)
+
+    out_path = f"{partition}/part-{uuid.uuid4().hex}.parquet"
+    pq.write_table(table, out_path, filesystem=fs, compression="zstd")
+    for path in files:
+        fs.delete_file(path)
+    return out_path, table.num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store_uri", help="s3://bucket/<RESULTS_STORE_PREFIX>")
+    parser.add_argument("--dataset", choices=list(DATASETS), action="append",
+                        help="dataset to compact (default: all)")
+    parser.add_argument("--min-files", type=int, default=2, help="skip partitions with fewer files")
+    args = parser.parse_args()
+
+    fs, root = pafs.FileSystem.from_uri(args.store_uri)
+    for name in args.dataset or list(DATASETS):
+        key, ts_column = DATASETS[name]
+        for partition, files in sorted(list_partitions(fs, f"{root.rstrip('/')}/{name}").items()):
+            if len(files) < args.min_files:
+                continue
+            out_path, rows = compact_partition(fs, partition, files, key, ts_column)
+            print(f"[INFO] {partition}: {len(files)} files -> {out_path} ({rows} rows)")
+
+
+if __name__ == "__main__":
+    main()
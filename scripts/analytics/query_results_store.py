@@ -0,0 +1,133 @@
+"""
+Query helper for the Parquet results store written by the Lambdas when
+RESULTS_STORE_PREFIX is set:
+
+  s3://<RESULTS_BUCKET>/<prefix>documents/dt=<YYYY-MM-DD>/case_id=<CASE_ID>/*.parquet
+  s3://<BUCKET_NAME>/<prefix>textract_jobs/dt=<YYYY-MM-DD>/*.parquet
+
+Partition pruning (dt, case_id) and column projection mean a report only reads
+the files and columns it needs instead of scanning the DynamoDB tables. Run
+compact_results_store.py regularly so each partition is a single file.
+
+Examples:
+    python scripts/analytics/query_results_store.py documents s3://bucket/results_store/ \\
+        --start 2025-06-01 --end 2025-06-30 --status SUCCESS --fields contenido_denuncia_from_txt
+    python scripts/analytics/query_results_store.py textract_jobs s3://bucket/results_store/ --out jobs.csv
+"""
+import argparse
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Partition keys are read as strings (case ids keep their leading zeros)
+PARTITION_SCHEMAS = {
+    "documents": pa.schema([("dt", pa.string()), ("case_id", pa.string())]),
+    "textract_jobs": pa.schema([("dt", pa.string())]),
+}
+
+
+def _dataset(store_uri, name, partition_filter=None):
+    path = f"{store_uri.rstrip('/')}/{name}/"
+    partitioning = ds.partitioning(PARTITION_SCHEMAS[name], flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+    # Files written with different RESULTS_STORE_FIELDS have different columns.
+    # Only the footers of the files in the selected partitions are read.
+    fragments = dataset.get_fragments(filter=partition_filter)
+    schemas = [fragment.physical_schema for fragment in fragments]
+    if not schemas:
+        return dataset
+    schema = pa.unify_schemas(schemas + [PARTITION_SCHEMAS[name]])
+    return ds.dataset(path, format="parquet", partitioning=partitioning, schema=schema)
+
+
+def _date_filter(start=None, end=None):
+    expr = None
+    if start:
+        expr = ds.field("dt") >= start
+    if end:
+        cond = ds.field("dt") <= end
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _and(expr, cond):
+    return cond if expr is None else expr & cond
+
+
+def query_documents(store_uri, start=None, end=None, case_id=None, status=None, columns=None, fields=None):
+    """
+    Documents processed by BDA/LLM as a pyarrow Table.
+    fields: inference_result keys to return as columns. Promoted fields are
+    read as their own column; any other comes out of the extra_fields map.
+    """
+    expr = _date_filter(start, end)
+    if case_id:
+        expr = _and(expr, ds.field("case_id") == str(case_id))
+    dataset = _dataset(store_uri, "documents", expr)
+    if status:
+        expr = _and(expr, ds.field("status") == status)
+
+    fields = fields or []
+    read_columns = list(columns) if columns else ["document_id", "case_id", "dt", "status", "original_key"]
+    read_columns += [name for name in fields if name in dataset.schema.names and name not in read_columns]
+    if fields and "extra_fields" not in read_columns:
+        read_columns.append("extra_fields")
+    table = dataset.to_table(columns=read_columns, filter=expr)
+
+    if fields:
+        # A field is a column in files written while it was promoted and a map
+        # entry in the others
+        rows = [dict(entries or []) for entries in table["extra_fields"].to_pylist()]
+        for name in fields:
+            values = table[name].to_pylist() if name in table.column_names else [None] * table.num_rows
+            merged = pa.array([v if v is not None else row.get(name) for v, row in zip(values, rows)], type=pa.string())
+            if name in table.column_names:
+                table = table.set_column(table.column_names.index(name), name, merged)
+            else:
+                table = table.append_column(name, merged)
+        if not (columns and "extra_fields" in columns):
+            table = table.drop_columns(["extra_fields"])
+    return table
+
+
+def query_textract_jobs(store_uri, start=None, end=None, status=None, columns=None):
+    """
+    Textract jobs with their per-page confidences as a pyarrow Table.
+    """
+    expr = _date_filter(start, end)
+    dataset = _dataset(store_uri, "textract_jobs", expr)
+    if status:
+        expr = _and(expr, ds.field("status") == status)
+    return dataset.to_table(columns=list(columns) if columns else None, filter=expr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=["documents", "textract_jobs"])
+    parser.add_argument("store_uri", help="s3://bucket/<RESULTS_STORE_PREFIX>")
+    parser.add_argument("--start", help="first dt partition (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last dt partition (YYYY-MM-DD)")
+    parser.add_argument("--case-id")
+    parser.add_argument("--status")
+    parser.add_argument("--columns", nargs="*")
+    parser.add_argument("--fields", nargs="*", help="inference fields to extract (documents only)")
+    parser.add_argument("--out", help="write CSV instead of printing")
+    args = parser.parse_args()
+
+    if args.dataset == "documents":
+        table = query_documents(args.store_uri, args.start, args.end, args.case_id, args.status,
+                                args.columns, args.fields)
+    else:
+        table = query_textract_jobs(args.store_uri, args.start, args.end, args.status, args.columns)
+
+    if args.out:
+        import pyarrow.csv as pcsv
+        pcsv.write_csv(table.drop_columns([c for c in ("extra_fields", "page_confidence") if c in table.column_names]),
+                       args.out)
+        print(f"{table.num_rows} rows written to {args.out}")
+    else:
+        print(table.to_string(preview_cols=len(table.column_names)) if table.num_rows else "No rows")
+
+
+if __name__ == "__main__":
+    main()
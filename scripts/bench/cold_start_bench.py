@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark for the Lambda scripts.
+
+Imports each Lambda module in a fresh interpreter (dummy env variables, no AWS
+calls) and reports the module init duration. Pass --rev to also measure the
+same files at a previous git revision, e.g.:
+
+    python scripts/bench/cold_start_bench.py --rev HEAD~1 --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+LAMBDAS = {
+    "processor": "scripts/lambda/la-positiva-poc-ocr-ml-processor-dev.py",
+    "finish": "scripts/lambda/la-positiva-poc-ocr-ml-text-finish-complaint-text-detection-dev.py",
+}
+
+DUMMY_ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "SOURCE_BUCKET": "bench",
+    "RESULTS_BUCKET": "bench",
+    "DOCUMENTS_TABLE": "bench",
+    "BDA_PROJECT_ARN": "arn:aws:bedrock:us-east-1:000000000000:data-automation-project/bench",
+    "SOURCE_PREFIX": "source/",
+    "BUCKET_NAME": "bench",
+    "TARGET_PREFIX": "filtered/",
+    "TARGET_ALL_WORDS_PREFIX": "filtered_all_words/",
+    "PROCESSED_PREFIX": "processed/",
+    "DYNAMO_TABLE": "bench",
+}
+
+# Runs inside the child interpreter: time the whole module import
+CHILD_CODE = """
+import importlib.util, sys, time
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("bench_module", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(f"BENCH_INIT_MS={(time.perf_counter() - t0) * 1000:.3f}")
+"""
+
+
+def measure(path, runs):
+    env = dict(os.environ, **DUMMY_ENV)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD_CODE, path],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        for line in out.splitlines():
+            if line.startswith("BENCH_INIT_MS="):
+                samples.append(float(line.split("=", 1)[1]))
+    return samples
+
+
+def file_at_rev(rev, rel_path, tmp_dir):
+    content = subprocess.run(
+        ["git", "show", f"{rev}:{rel_path}"],
+        cwd=REPO_ROOT, capture_output=True, check=True,
+    ).stdout
+    out_path = os.path.join(tmp_dir, f"{rev.replace('/', '_').replace('~', '_')}_{os.path.basename(rel_path)}")
+    with open(out_path, "wb") as f:
+        f.write(content)
+    return out_path
+
+
+def report(label, samples):
+    print(f"{label:<28} median {statistics.median(samples):8.1f} ms   "
+          f"min {min(samples):8.1f} ms   max {max(samples):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rev", help="git revision to compare against (before)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, rel_path in LAMBDAS.items():
+            if args.rev:
+                report(f"{name} @ {args.rev}", measure(file_at_rev(args.rev, rel_path, tmp_dir), args.runs))
+            report(f"{name} @ working tree", measure(os.path.join(REPO_ROOT, rel_path), args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark: exact substring keyword matcher vs the OCR-tolerant (trigram
+index, bounded edit distance) matcher of the finish Lambda, on recorded
+Textract output.
+
+Each input file is a saved GetDocumentTextDetection response (or a JSON list
+of paginated responses). Example:
+
+    python scripts/bench/keyword_matcher_bench.py recorded/*.json --repeat 20
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+from collections import defaultdict
+
+from cold_start_bench import DUMMY_ENV, LAMBDAS, REPO_ROOT
+
+
+def load_finish_lambda():
+    os.environ.update({k: v for k, v in DUMMY_ENV.items() if k not in os.environ})
+    spec = importlib.util.spec_from_file_location("finish_lambda", os.path.join(REPO_ROOT, LAMBDAS["finish"]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_pages(paths):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        responses = data if isinstance(data, list) else [data]
+        lines = defaultdict(list)
+        for resp in responses:
+            for block in resp.get("Blocks", []):
+                if block["BlockType"] == "LINE":
+                    lines[block["Page"]].append(block["Text"])
+        pages.extend(" ".join(page_lines).lower() for _, page_lines in sorted(lines.items()))
+    return pages
+
+
+def run(matcher, pages, repeat, min_hits):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        hits = [matcher(page) for page in pages]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    return elapsed_ms, sum(hits), sum(1 for h in hits if h >= min_hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="recorded Textract JSON responses")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    module = load_finish_lambda()
+    pages = load_pages(args.files)
+    total_chars = sum(len(p) for p in pages)
+    print(f"{len(pages)} pages, {total_chars} chars, {len(module.KEYWORDS)} keywords")
+
+    for name, matcher in (("exact", module.count_keyword_hits_exact), ("fuzzy", module.count_keyword_hits_fuzzy)):
+        elapsed_ms, hits, matched = run(matcher, pages, args.repeat, module.MIN_HITS)
+        print(f"{name:<6} {elapsed_ms:9.2f} ms/run   {elapsed_ms * 1000 / max(len(pages), 1):8.1f} us/page   "
+              f"keyword hits {hits:6d}   pages >= MIN_HITS {matched:5d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import sys
 import boto3
 import time, io, os, json
+import hashlib
+import uuid
 import zipfile
 from datetime import datetime
 from awsglue.utils import getResolvedOptions
 
+# Optional arguments are only resolved when passed to the job
+OPTIONAL_ARGS = [name for name in ['HASH_TABLE', 'ORIGINAL_MAX_WAIT_MINUTES'] if f'--{name}' in sys.argv]
+
 # Define the expected arguments
-args = getResolvedOptions(sys.argv, ['BUCKET_NAME', 'SOURCE_PREFIX', 'PROCESSED_PREFIX', 'DYNAMO_TABLE', 'TOPIC_ARN', 'ROLE_ARN'])
+args = getResolvedOptions(sys.argv, ['BUCKET_NAME', 'SOURCE_PREFIX', 'PROCESSED_PREFIX', 'DYNAMO_TABLE', 'TOPIC_ARN', 'ROLE_ARN'] + OPTIONAL_ARGS)
 
 BUCKET = args['BUCKET_NAME']
 PREFIX = args['SOURCE_PREFIX']
@@ -14,6 +19,12 @@ PROCESSED_PREFIX = args['PROCESSED_PREFIX']
 DYNAMO_TABLE = args['DYNAMO_TABLE']
 TOPIC_ARN = args['TOPIC_ARN']
 ROLE_ARN =  args['ROLE_ARN']
+# content_hash -> first job_id; duplicate detection is disabled without it
+HASH_TABLE = args.get('HASH_TABLE')
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+# Copies of an original still IN_PROGRESS wait in source/ at most this long,
+# then are dispatched on their own (e.g. the original's SNS message was lost)
+ORIGINAL_MAX_WAIT_MINUTES = int(args.get('ORIGINAL_MAX_WAIT_MINUTES', '60'))
 
 #SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.jfif')
 SUPPORTED_EXTENSIONS = ('.pdf')
@@ -22,6 +33,7 @@ dynamodb = boto3.resource('dynamodb')
 ddb_table = dynamodb.Table(DYNAMO_TABLE)
 s3 = boto3.client('s3')
 textract = boto3.client('textract')
+hash_table = dynamodb.Table(HASH_TABLE) if HASH_TABLE else None
 
 def list_supported_files(bucket, prefix):
     paginator = s3.get_paginator("list_objects_v2")
@@ -116,8 +128,94 @@ def record_job_metadata(job_id, s3_key, from_zip, zip_key):
         'file_type': os.path.splitext(s3_key)[-1].lstrip('.').lower()
     })
 
+# ───── Duplicate detection by content hash ─────────────────────────
+def get_content_hash(s3_key):
+    """
+    MD5 of the object content, taken from the ETag when it is a plain MD5
+    (single-part upload, not SSE-KMS) and streamed otherwise, so copies of a
+    document hash the same regardless of how they were uploaded.
+    Returns (content_hash, size_bytes).
+    """
+    head = s3.head_object(Bucket=BUCKET, Key=s3_key)
+    size = head['ContentLength']
+    etag = head['ETag'].strip('"')
+
+    if '-' not in etag and head.get('ServerSideEncryption') != 'aws:kms':
+        return f"md5:{etag}", size
+
+    digest = hashlib.md5(usedforsecurity=False)
+    body = s3.get_object(Bucket=BUCKET, Key=s3_key)['Body']
+    for chunk in body.iter_chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return f"md5:{digest.hexdigest()}", size
+
+def find_original_job(content_hash):
+    """
+    Job already started for this content, unless that job failed, its item
+    is missing or it stayed IN_PROGRESS longer than ORIGINAL_MAX_WAIT_MINUTES.
+    Only a PROCESSED original makes the copy a final duplicate; callers leave
+    copies of IN_PROGRESS originals in the source prefix for the next run.
+    """
+    entry = hash_table.get_item(Key={'content_hash': content_hash}).get('Item')
+    if not entry:
+        return None
+
+    job = ddb_table.get_item(Key={'job_id': entry['job_id']}).get('Item')
+    if not job or job.get('status') == 'FAILED':
+        return None
+    if job.get('status') != 'PROCESSED':
+        started = job.get('timestamp')
+        if not started or (datetime.utcnow() - datetime.fromisoformat(started)).total_seconds() > ORIGINAL_MAX_WAIT_MINUTES * 60:
+            print(f"[WARN] Original job {entry['job_id']} is {job.get('status')} since {started}, dispatching the copy")
+            return None
+    return {**entry, 'status': job.get('status'), 'page_count': job.get('page_count'),
+            'filtered_key': job.get('filtered_key'), 'txt_key': job.get('txt_key')}
+
+def record_content_hash(content_hash, job_id, s3_key, size):
+    hash_table.put_item(Item={
+        'content_hash': content_hash,
+        'job_id': job_id,
+        's3_key': s3_key,
+        'size_bytes': size,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+def extract_case_id_from_key(key):
+    """
+    Expected pattern:
+      source/<any_folder>/<CASE_ID>/<filename>.pdf
+    Returns CASE_ID as a string or None if not found.
+    """
+    parts = key.strip("/").split("/")
+    if len(parts) >= 3 and parts[2].isdigit():
+        return parts[2]
+    return None
+
+def record_duplicate(s3_key, content_hash, size, original):
+    """
+    Link the duplicate to the original job's outputs instead of running OCR/BDA/LLM again.
+    The duplicate's case_id and the original's filtered / txt keys let the
+    results be looked up per case.
+    """
+    ddb_table.put_item(Item={
+        'job_id': f"duplicate_{uuid.uuid4().hex}",
+        's3_key': s3_key,
+        'case_id': extract_case_id_from_key(s3_key),
+        'status': 'DUPLICATE',
+        'timestamp': datetime.utcnow().isoformat(),
+        'file_type': os.path.splitext(s3_key)[-1].lstrip('.').lower(),
+        'content_hash': content_hash,
+        'size_bytes': size,
+        'duplicate_of': original['job_id'],
+        'original_s3_key': original['s3_key'],
+        'original_case_id': extract_case_id_from_key(original['s3_key']),
+        'original_filtered_key': original.get('filtered_key'),
+        'original_txt_key': original.get('txt_key')
+    })
+
 def main():
     files_processed = 0
+    dedupe_report = {'duplicates': 0, 'bytes_saved': 0, 'pages_saved': 0, 'deferred': 0}
     for s3_key, source_type, zip_key in list_supported_files(BUCKET, PREFIX):
         print(s3_key)
         try:
@@ -136,12 +234,39 @@ def main():
             #    break;
 
 
+            content_hash = None
+            if hash_table:
+                content_hash, size = get_content_hash(s3_key)
+                original = find_original_job(content_hash)
+                if original and original['status'] != 'PROCESSED':
+                    # Original still running: it may yet fail, so keep the copy in source/
+                    print(f"[INFO] Deferred, original job {original['job_id']} is {original['status']}: {s3_key}")
+                    dedupe_report['deferred'] += 1
+                    continue
+                if original:
+                    record_duplicate(s3_key, content_hash, size, original)
+                    move_s3_object(s3_key, PROCESSED_PREFIX)
+                    print(f"[INFO] Duplicate of job {original['job_id']} ({original['s3_key']}): {s3_key}")
+
+                    dedupe_report['duplicates'] += 1
+                    dedupe_report['bytes_saved'] += size
+                    dedupe_report['pages_saved'] += int(original.get('page_count') or 0)
+                    continue
+
             job_id = start_textract_job(s3_key)
             print(f"[INFO] Started Textract job: {job_id} for {s3_key}")
             record_job_metadata(job_id, s3_key, from_zip=source_type, zip_key=zip_key)
+            if content_hash:
+                record_content_hash(content_hash, job_id, s3_key, size)
 
         except Exception as e:
             print(f"[ERROR] Failed to start job for {s3_key}: {e}")
 
+    if hash_table:
+        print(f"[SUMMARY] Duplicates skipped: {dedupe_report['duplicates']}, "
+              f"bytes saved: {dedupe_report['bytes_saved']}, pages saved: {dedupe_report['pages_saved']} "
+              f"(deferred until their original finishes: {dedupe_report['deferred']})")
+        print(f"[SUMMARY] Dedupe report: {json.dumps(dedupe_report)}")
+
 if __name__ == "__main__":
     main()
@@ -4,9 +4,12 @@ import botocore
 import logging
 import os
 from datetime import datetime
+from functools import lru_cache
+import threading
 import uuid
 import time
 from urllib.parse import urlparse
+from botocore.config import Config
 
 BEDROCK_MODEL_ID = "amazon.nova-micro-v1:0"          # On-demand Nova Micro
 #amazon.nova-lite-v1:0
@@ -35,16 +38,64 @@ Documento:
 >>>
 """
 
+# Case batching: several denuncias of the same case in a single Nova call
+BEDROCK_BATCH_INVOCATION_PARAMS = {
+    "maxTokens": 10000,
+    "temperature": 0.1,
+}
+
+BATCH_PROMPT_TEMPLATE = """\
+Eres un asistente experto en procesar denuncias policiales en español.
+Recibirás varios documentos del mismo caso, cada uno delimitado por <<<id ... >>>.
+Para CADA documento extrae la narrativa y devuelve SOLO el siguiente JSON:
+{{
+  "documentos": [
+    {{"id": "<id del documento>", "contenido_denuncia": "<toda la narrativa completa de los hechos>"}}
+  ]
+}}
+
+Reglas:
+- Empieza después de encabezados como "Contenido", "Descripción de los hechos", "Acta de" o "Resumen".
+- Incluye todos los párrafos, aunque estén en distintas páginas.
+- Detente antes de los encabezados "Instructor", "Fdo el Instructor", "Interviniente" o "Autentificador".
+- No mezcles contenido entre documentos.
+- Devuelve ÚNICAMENTE JSON válido.
+
+Documentos:
+{documents}
+"""
+
+BATCH_DOCUMENT_TEMPLATE = """\
+<<<{doc_id}
+{document_text}
+>>>
+"""
+
 
 # Logging conf
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS Clients
-bda_client = boto3.client('bedrock-data-automation-runtime', region_name='us-east-1')
-bedrock  = boto3.client("bedrock-runtime", region_name='us-east-1')
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+# AWS Clients (built lazily on first use, reused across warm invocations)
+BEDROCK_REGION = 'us-east-1'
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '10')),
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    connect_timeout=5,
+    read_timeout=60,
+)
+
+_clients_lock = threading.Lock()  # boto3 session creation is not thread-safe
+
+@lru_cache(maxsize=None)
+def get_client(service_name, region_name=None):
+    with _clients_lock:
+        return boto3.client(service_name, region_name=region_name, config=BOTO_CONFIG)
+
+@lru_cache(maxsize=None)
+def get_dynamodb():
+    with _clients_lock:
+        return boto3.resource('dynamodb', config=BOTO_CONFIG)
 
 # Env variables
 REGION = os.environ['AWS_REGION']
@@ -54,10 +105,38 @@ DOCUMENTS_TABLE = os.environ['DOCUMENTS_TABLE']
 BDA_PROJECT_ARN = os.environ['BDA_PROJECT_ARN']
 SOURCE_PREFIX = os.environ['SOURCE_PREFIX']
 
+# Case batching (disabled when the window is 0 or there is no lock table).
+# CASE_LOCK_TABLE: partition key case_id, TTL on expires_at.
+# Window and batch size are capped so a batch fits in the 900 s Lambda limit.
+CASE_LOCK_TABLE = os.environ.get('CASE_LOCK_TABLE', '')
+CASE_BATCH_WINDOW_SECONDS = min(int(os.environ.get('CASE_BATCH_WINDOW_SECONDS', '0')), 60)
+CASE_BATCH_MAX_FILES = min(int(os.environ.get('CASE_BATCH_MAX_FILES', '10')), 10)
+CASE_BATCH_MAX_CHARS = int(os.environ.get('CASE_BATCH_MAX_CHARS', '20000'))   # OCR text per Nova call
+CASE_BATCH_LOCK_TTL = 900       # seconds a case lock (running or done) is kept before it can be taken over
+CASE_BATCH_SAFETY_SECONDS = 60  # kept free before the Lambda timeout to register failures
+
+# Columnar results store (Parquet in RESULTS_BUCKET, disabled when empty).
+# Needs pyarrow in the Lambda (e.g. the AWS SDK for pandas layer).
+RESULTS_STORE_PREFIX = os.environ.get('RESULTS_STORE_PREFIX', '')
+RESULTS_STORE_STATUSES = ('SUCCESS', 'FAILED')
+# inference_result fields stored as their own columns; the rest go to extra_fields
+RESULTS_STORE_FIELDS = ['contenido_denuncia_from_txt'] + [
+    f.strip() for f in os.environ.get('RESULTS_STORE_FIELDS', '').split(',') if f.strip()
+]
+
 # Verify BDA state
 MAX_POLLS       = 60            # ~10 min at 10‑sec intervals
 POLL_INTERVAL   = 10            # seconds
 
+@lru_cache(maxsize=1)
+def get_account_id():
+    return get_client('sts').get_caller_identity()['Account']
+
+@lru_cache(maxsize=1)
+def get_profile_arn():
+    return f'arn:aws:bedrock:{REGION}:{get_account_id()}:data-automation-profile/us.data-automation-v1'
+
+
 def lambda_handler(event, context):
 
     print("Init function")
@@ -70,7 +149,7 @@ def lambda_handler(event, context):
         # Process a S3 event
         if 'source' in event and event['source'] == 'aws.s3':
             print("A File from Event bridge found!")
-            return handle_s3_event(event)
+            return handle_s3_event(event, context)
         else:
             logger.warning("Event type not recognized")
             return {'statusCode': 400, 'body': 'Event not supported'}
@@ -79,7 +158,7 @@ def lambda_handler(event, context):
         logger.error(f"Error in lambda_handler: {str(e)}")
         raise
 
-def handle_s3_event(event):
+def handle_s3_event(event, context=None):
     """
     Process S3 event when a pdf file is uploaded
     """
@@ -98,6 +177,8 @@ def handle_s3_event(event):
 
         # Process document
         print("\n Before process the document")
+        if CASE_BATCH_WINDOW_SECONDS > 0 and CASE_LOCK_TABLE:
+            return process_case_batch(bucket_name, object_key, context)
         return process_document(bucket_name, object_key)
 
     except Exception as e:
@@ -129,29 +210,15 @@ def process_document(bucket_name, object_key):
         # Register in Dynamo - Initial state
         register_document(document_id, case_id, object_key, input_uri, output_uri, 'INITIATED')
 
-        # Get Account ID
-        account_id = boto3.client('sts').get_caller_identity()['Account']
-        profile_arn = f'arn:aws:bedrock:{REGION}:{account_id}:data-automation-profile/us.data-automation-v1'
+        # Account ID / profile ARN are resolved once per container
+        profile_arn = get_profile_arn()
 
         #print(f"\n profile_arn bedrock: {profile_arn}")
         # Invoke BDA
         logger.info(f"Send to BDA: {input_uri}")
 
         print(f"\n BDA_PROJECT_ARN bedrock: {BDA_PROJECT_ARN}")
-        response = bda_client.invoke_data_automation_async(
-            inputConfiguration={'s3Uri': input_uri},
-            outputConfiguration={'s3Uri': output_uri},
-            dataAutomationConfiguration={
-                'dataAutomationProjectArn': BDA_PROJECT_ARN,
-                'stage': 'LIVE'
-            },
-            dataAutomationProfileArn=profile_arn
-        )
-
-        invocation_arn = response['invocationArn']
-        logger.info(f"BDA iniciado: {invocation_arn}")
-
-        invocation_arn = response['invocationArn']
+        invocation_arn = start_bda(input_uri, output_uri, profile_arn)
         logger.info(f"BDA iniciado: {invocation_arn}")
 
         # Update Dynamo status
@@ -184,14 +251,8 @@ def process_document(bucket_name, object_key):
         ### Content with LLM section ###
         try:
             ##### LLM ###
-            txt_object_key = object_key.replace("filtered/", "filtered_all_words/")
-            txt_object_key = txt_object_key.replace(".pdf", "_all_words.txt")
-
-            print(f"\n txt_object_key: {txt_object_key}")
-
             # Read OCR text from S3
-            obj = s3_client.get_object(Bucket=bucket_name, Key=txt_object_key)
-            document_text = obj["Body"].read().decode("utf-8", errors="replace")
+            document_text = read_ocr_text(bucket_name, object_key)
             #print(document_text)
 
             # Destination key for LLM analysis
@@ -201,32 +262,13 @@ def process_document(bucket_name, object_key):
             dest_key = f"txt_processed/{document_id}_case_{case_id}.json"
             #print(f"Result bda url: {key_result_bda_url} and dest key {dest_key}")
 
-            # Prepare prompt
-            prompt = PROMPT_TEMPLATE.format(document_text=document_text)
-            messages = [{"role": "user", "content": [{"text": prompt}]}]
-
-            #Call Bedrock Amazon Nova Micro
-            resp = bedrock.converse(
-                modelId=BEDROCK_MODEL_ID,
-                messages=messages,
-                inferenceConfig=BEDROCK_INVOCATION_PARAMS,
-            )
-
-            model_text = resp["output"]["message"]["content"][0]["text"]
+            # Prepare prompt and call Bedrock Amazon Nova Micro
+            model_text = converse(PROMPT_TEMPLATE.format(document_text=document_text), BEDROCK_INVOCATION_PARAMS)
             #print(f"Response model: {model_text}")
             payload = _coerce_to_json(model_text)
 
-            #Build destination key (mirror path, change .txt -> .json)
-            out_bytes = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
-
             # Write JSON to destination bucket
-            s3_client.put_object(
-                Bucket=RESULTS_BUCKET,
-                Key=dest_key,
-                Body=out_bytes,
-                ContentType="application/json; charset=utf-8",
-                CacheControl="no-cache",
-            )
+            save_llm_result(dest_key, payload)
 
             final_result = json.loads(ocr_results)
             #print('Before updating final result')
@@ -268,11 +310,381 @@ def process_document(bucket_name, object_key):
         raise
 
 
+def start_bda(input_uri, output_uri, profile_arn):
+    """
+    Start an async BDA invocation and return its invocation ARN
+    """
+    response = get_client('bedrock-data-automation-runtime', BEDROCK_REGION).invoke_data_automation_async(
+        inputConfiguration={'s3Uri': input_uri},
+        outputConfiguration={'s3Uri': output_uri},
+        dataAutomationConfiguration={
+            'dataAutomationProjectArn': BDA_PROJECT_ARN,
+            'stage': 'LIVE'
+        },
+        dataAutomationProfileArn=profile_arn
+    )
+    return response['invocationArn']
+
+
+def read_ocr_text(bucket_name, object_key):
+    """
+    Read the all-words txt written by the Textract finish Lambda for a filtered PDF
+    """
+    txt_object_key = object_key.replace("filtered/", "filtered_all_words/")
+    txt_object_key = txt_object_key.replace(".pdf", "_all_words.txt")
+
+    print(f"\n txt_object_key: {txt_object_key}")
+
+    obj = get_client('s3').get_object(Bucket=bucket_name, Key=txt_object_key)
+    return obj["Body"].read().decode("utf-8", errors="replace")
+
+
+def converse(prompt, inference_config):
+    """
+    Call Bedrock Amazon Nova and return the text of the answer
+    """
+    messages = [{"role": "user", "content": [{"text": prompt}]}]
+    resp = get_client('bedrock-runtime', BEDROCK_REGION).converse(
+        modelId=BEDROCK_MODEL_ID,
+        messages=messages,
+        inferenceConfig=inference_config,
+    )
+    return resp["output"]["message"]["content"][0]["text"]
+
+
+def save_llm_result(dest_key, payload):
+    """
+    Write the LLM JSON payload to RESULTS_BUCKET
+    """
+    out_bytes = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    get_client('s3').put_object(
+        Bucket=RESULTS_BUCKET,
+        Key=dest_key,
+        Body=out_bytes,
+        ContentType="application/json; charset=utf-8",
+        CacheControl="no-cache",
+    )
+
+
+def process_case_batch(bucket_name, object_key, context=None):
+    """
+    Case-batching mode: wait CASE_BATCH_WINDOW_SECONDS for sibling PDFs of the
+    same case, then process them all in this invocation. The invocation that
+    locks the case owns the batch; siblings included in the batch return early.
+    When the batch ends the lock item is marked done but kept until it expires,
+    so siblings that wake up later still find their key in it. A retry of the
+    owner re-enters and only runs the documents that did not reach SUCCESS.
+    """
+    try:
+        case_id = extract_case_id_from_key(object_key)
+    except ValueError:
+        return process_document(bucket_name, object_key)
+
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - CASE_BATCH_SAFETY_SECONDS
+
+    time.sleep(CASE_BATCH_WINDOW_SECONDS)
+
+    object_keys = list_case_documents(bucket_name, object_key)
+    locked, batch_keys, done_keys = lock_case_batch(case_id, object_key, object_keys)
+    if not locked:
+        if object_key in batch_keys:
+            logger.info(f"{object_key} is handled by the batch of case {case_id}")
+            return {'statusCode': 200, 'body': 'Batched with sibling documents'}
+        # Arrived after the batch was listed: process on its own
+        return process_document(bucket_name, object_key)
+
+    pending_keys = [key for key in batch_keys if key not in done_keys]
+    print(f"Case {case_id} batch with {len(pending_keys)} documents ({len(done_keys)} already done)")
+    try:
+        return run_case_batch(bucket_name, case_id, pending_keys, deadline)
+    finally:
+        finish_case_batch(case_id, object_key)
+
+
+def list_case_documents(bucket_name, object_key):
+    """
+    PDFs in the same case folder written within the batching window of object_key
+    """
+    case_prefix = object_key.rsplit("/", 1)[0] + "/"
+    paginator = get_client('s3').get_paginator("list_objects_v2")
+
+    objects = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=case_prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            if key.lower().endswith(".pdf") and "/" not in key[len(case_prefix):]:
+                objects.append(obj)
+
+    # Older files of the case were already processed by previous runs
+    trigger = next((obj for obj in objects if obj["Key"] == object_key), None)
+    if trigger:
+        cutoff = trigger["LastModified"].timestamp() - CASE_BATCH_WINDOW_SECONDS
+        objects = [obj for obj in objects if obj["LastModified"].timestamp() >= cutoff]
+
+    keys = [obj["Key"] for obj in sorted(objects, key=lambda obj: obj["LastModified"])]
+    if object_key in keys:
+        keys.remove(object_key)
+    return [object_key] + keys[:CASE_BATCH_MAX_FILES - 1]
+
+
+def lock_case_batch(case_id, owner_key, object_keys):
+    """
+    Conditionally lock the case in CASE_LOCK_TABLE. The lock is granted when
+    free or expired; a retried invocation of owner_key re-enters with the keys
+    it locked first.
+    Returns (locked, object keys of the batch that holds the case, keys already done).
+    """
+    table = get_dynamodb().Table(CASE_LOCK_TABLE)
+    now = int(time.time())
+
+    try:
+        table.put_item(
+            Item={
+                'case_id': case_id,
+                'owner_key': owner_key,
+                'object_keys': object_keys,
+                'expires_at': now + CASE_BATCH_LOCK_TTL,
+                'created_at': datetime.now().isoformat(),
+            },
+            ConditionExpression="attribute_not_exists(case_id) OR expires_at < :now",
+            ExpressionAttributeValues={":now": now},
+        )
+        return True, object_keys, set()
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+    existing = table.get_item(Key={'case_id': case_id}, ConsistentRead=True).get("Item", {})
+    if existing.get("owner_key") != owner_key:
+        return False, existing.get("object_keys", []), set()
+
+    # Retry of the owner: renew the lock and resume the same batch
+    table.update_item(
+        Key={'case_id': case_id},
+        UpdateExpression="SET expires_at = :expires REMOVE done",
+        ConditionExpression="owner_key = :owner",
+        ExpressionAttributeValues={":expires": now + CASE_BATCH_LOCK_TTL, ":owner": owner_key},
+    )
+    return True, existing["object_keys"], set(existing.get("done_keys", []))
+
+
+def mark_case_document_done(case_id, object_key):
+    try:
+        get_dynamodb().Table(CASE_LOCK_TABLE).update_item(
+            Key={'case_id': case_id},
+            UpdateExpression="ADD done_keys :key",
+            ExpressionAttributeValues={":key": {object_key}},
+        )
+    except Exception as e:
+        # Only costs a rerun of the document if the owner is retried
+        logger.warning(f"Error marking {object_key} done in case {case_id}: {e}")
+
+
+def finish_case_batch(case_id, owner_key):
+    try:
+        get_dynamodb().Table(CASE_LOCK_TABLE).update_item(
+            Key={'case_id': case_id},
+            UpdateExpression="SET done = :done, finished_at = :finished",
+            ConditionExpression="owner_key = :owner",
+            ExpressionAttributeValues={":done": True, ":finished": datetime.now().isoformat(), ":owner": owner_key},
+        )
+    except Exception as e:
+        # The item still expires through expires_at
+        logger.warning(f"Error marking batch of case {case_id} done: {e}")
+
+
+def run_case_batch(bucket_name, case_id, object_keys, deadline=None):
+    """
+    Start BDA for every document, poll them together, extract contenido_denuncia
+    for the whole case in as few Nova calls as possible and demultiplex the
+    results back to one DynamoDB item / S3 JSON per document.
+    On any unexpected error every unfinished document is registered FAILED.
+    """
+    docs = []
+    for object_key in object_keys:
+        document_id = f"{object_key.rsplit("/", 1)[-1].replace('.pdf', '')}_{uuid.uuid4().hex[:8]}"
+        docs.append({
+            'document_id': document_id,
+            'object_key': object_key,
+            'input_uri': f"s3://{bucket_name}/{object_key}",
+            'output_uri': f"s3://{RESULTS_BUCKET}/processed/{document_id}",
+            'dest_key': f"txt_processed/{document_id}_case_{case_id}.json",
+            'status': 'PROCESSING',
+        })
+
+    try:
+        _run_case_batch(bucket_name, case_id, docs, deadline)
+    except Exception as e:
+        logger.error(f"Error procesando batch del caso {case_id}: {str(e)}")
+        for doc in docs:
+            if doc['status'] not in ('SUCCESS', 'FAILED'):
+                doc['status'] = 'FAILED'
+                try:
+                    register_document(doc['document_id'], case_id, doc['object_key'], doc['input_uri'],
+                                      doc['output_uri'], 'FAILED', doc.get('ocr_results'),
+                                      doc.get('from_custom_blueprint', False))
+                except Exception:
+                    pass
+        raise
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps(
+            {
+                "case_id": case_id,
+                "message": "Case batch processed",
+                "dest_bucket": RESULTS_BUCKET,
+                "documents": [
+                    {
+                        'document_id': doc['document_id'],
+                        'object_key': doc['object_key'],
+                        'dest_key_llm': doc['dest_key'],
+                        'bda_invocation_arn': doc.get('invocation_arn'),
+                        'status': doc['status'],
+                    }
+                    for doc in docs
+                ],
+            },
+            ensure_ascii=False,
+        ),
+    }
+
+
+def _run_case_batch(bucket_name, case_id, docs, deadline):
+    profile_arn = get_profile_arn()
+
+    for doc in docs:
+        try:
+            doc['invocation_arn'] = start_bda(doc['input_uri'], doc['output_uri'], profile_arn)
+            logger.info(f"BDA iniciado: {doc['invocation_arn']}")
+        except Exception as e:
+            logger.error(f"Error starting BDA for {doc['object_key']}: {str(e)}")
+            doc['status'] = 'FAILED'
+        register_document(doc['document_id'], case_id, doc['object_key'], doc['input_uri'], doc['output_uri'],
+                          doc['status'])
+
+    running = [doc for doc in docs if doc['status'] == 'PROCESSING']
+    bda_statuses = wait_for_bda_batch([doc['invocation_arn'] for doc in running], deadline)
+
+    for doc in running:
+        status_resp = bda_statuses[doc['invocation_arn']]
+        try:
+            if status_resp["status"] != "Success":
+                raise RuntimeError(f'BDA finished with error: {status_resp.get("errorType")} – '
+                                   f'{status_resp.get("errorMessage")}')
+            doc['ocr_results'], doc['from_custom_blueprint'], _ = fetch_results(
+                status_resp["outputConfiguration"]["s3Uri"], doc['document_id'])
+            doc['document_text'] = read_ocr_text(bucket_name, doc['object_key'])
+        except Exception as e:
+            logger.error(f"Error procesando documento {doc['object_key']}: {str(e)}")
+            register_document(doc['document_id'], case_id, doc['object_key'], doc['input_uri'],
+                              doc['output_uri'], 'FAILED', doc.get('ocr_results'), doc.get('from_custom_blueprint', False))
+            doc['status'] = 'FAILED'
+
+    ready = [doc for doc in running if doc['status'] == 'PROCESSING']
+    payloads = extract_contenido_denuncia_batch(ready, deadline)
+
+    for doc in ready:
+        try:
+            payload = payloads.get(doc['document_id'])
+            if payload is None:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("No time left in the Lambda for the single-document prompt")
+                # Not returned by the batched call: fall back to the single-document prompt
+                payload = _coerce_to_json(converse(PROMPT_TEMPLATE.format(document_text=doc['document_text']),
+                                                   BEDROCK_INVOCATION_PARAMS))
+            save_llm_result(doc['dest_key'], payload)
+
+            final_result = json.loads(doc['ocr_results'])
+            final_result['inference_result']["contenido_denuncia_from_txt"] = payload['contenido_denuncia']
+            register_document(doc['document_id'], case_id, doc['object_key'], doc['input_uri'], doc['output_uri'],
+                              'SUCCESS', json.dumps(final_result), doc['from_custom_blueprint'])
+            doc['status'] = 'SUCCESS'
+            mark_case_document_done(case_id, doc['object_key'])
+
+        except Exception as e:
+            logger.error(f"Error procesando documento en la extracion de contenido_denuncia con LLM: {str(e)}")
+            register_document(doc['document_id'], case_id, doc['object_key'], doc['input_uri'], doc['output_uri'],
+                              'FAILED', doc['ocr_results'], doc['from_custom_blueprint'])
+            doc['status'] = 'FAILED'
+
+
+def extract_contenido_denuncia_batch(docs, deadline=None):
+    """
+    One Nova call per group of documents (bounded by CASE_BATCH_MAX_CHARS).
+    Returns {document_id: payload} for the documents the model answered.
+    """
+    groups = []
+    current, current_chars = [], 0
+    for doc in docs:
+        size = len(doc['document_text'])
+        if current and current_chars + size > CASE_BATCH_MAX_CHARS:
+            groups.append(current)
+            current, current_chars = [], 0
+        current.append(doc)
+        current_chars += size
+    if current:
+        groups.append(current)
+
+    payloads = {}
+    for group in groups:
+        if len(group) < 2:
+            continue  # the single-document prompt is used for these
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        documents = "".join(
+            BATCH_DOCUMENT_TEMPLATE.format(doc_id=doc['document_id'], document_text=doc['document_text'])
+            for doc in group
+        )
+        try:
+            model_text = converse(BATCH_PROMPT_TEMPLATE.format(documents=documents), BEDROCK_BATCH_INVOCATION_PARAMS)
+            payloads.update(_demux_batch_response(model_text, {doc['document_id'] for doc in group}))
+        except Exception as e:
+            logger.warning(f"Batched LLM extraction failed, falling back per document: {e}")
+    return payloads
+
+
+def _demux_batch_response(text, document_ids):
+    """
+    Map the batched model answer back to {document_id: {"contenido_denuncia": ...}}
+    """
+    data = _parse_model_json(text)
+    payloads = {}
+    for entry in data.get("documentos", []):
+        if not isinstance(entry, dict):
+            continue
+        doc_id = entry.get("id")
+        contenido = entry.get("contenido_denuncia")
+        if doc_id in document_ids and isinstance(contenido, str):
+            payloads[doc_id] = {"contenido_denuncia": contenido}
+    return payloads
+
+
+def _parse_model_json(text):
+    """
+    Parse the JSON object of a model answer, tolerating ```json fences or
+    text around it.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0].strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+
 def register_document(document_id, case_id, original_key, input_uri, output_uri, status, results=None, from_custom_blueprint=False):
     """
     Register documento in DynamoDB
     """
-    table = dynamodb.Table(DOCUMENTS_TABLE)
+    table = get_dynamodb().Table(DOCUMENTS_TABLE)
 
     timestamp = datetime.now().isoformat()
 
@@ -290,23 +702,83 @@ def register_document(document_id, case_id, original_key, input_uri, output_uri,
     }
 
     # Extract and get field if needed
+    inference = {}
     if results:
         try:
             result_data = json.loads(results) if isinstance(results, str) else results
             inference = result_data.get("inference_result", {})
-
-            # Expand result keys, each one as column
-            if isinstance(inference, dict) and from_custom_blueprint == True:
-                item.update(inference)
-
+            if not isinstance(inference, dict):
+                inference = {}
         except Exception as e:
             logger.warning(f"Error parsing results for DynamoDB: {e}")
 
+    # Final results go to the columnar store; the DynamoDB item keeps keys and status
+    store_uri = None
+    if RESULTS_STORE_PREFIX and status in RESULTS_STORE_STATUSES:
+        try:
+            store_uri = write_results_store(item, inference, from_custom_blueprint)
+        except Exception as e:
+            logger.warning(f"Error writing results store, keeping results in DynamoDB: {e}")
+
+    if store_uri:
+        item['results'] = ''
+        item['results_store_uri'] = store_uri
+    elif from_custom_blueprint == True:
+        # Expand result keys, each one as column
+        item.update(inference)
+
     print(f"The item to register: ")
     table.put_item(Item=item)
     logger.info(f"Document registered: {document_id}")
 
 
+def write_results_store(item, inference, from_custom_blueprint):
+    """
+    Write one document row as a zstd Parquet file partitioned by date and case:
+      <RESULTS_STORE_PREFIX>documents/dt=<YYYY-MM-DD>/case_id=<CASE_ID>/<document_id>.parquet
+    RESULTS_STORE_FIELDS become string columns, other inference fields a string
+    map (non-string values JSON encoded). Small files are merged per partition
+    by scripts/analytics/compact_results_store.py, so the partition URI is
+    returned rather than the file's.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def as_str(value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    columns = {
+        'document_id': [item['document_id']],
+        'original_key': [item['original_key']],
+        'input_uri': [item['input_uri']],
+        'output_uri': [item['output_uri']],
+        'status': [item['status']],
+        'from_custom_blueprint': [bool(from_custom_blueprint)],
+        'processing_timestamp': [item['processing_timestamp']],
+    }
+    for name in RESULTS_STORE_FIELDS:
+        columns[name] = pa.array([as_str(inference.get(name))], type=pa.string())
+    extra_fields = [(k, as_str(v)) for k, v in inference.items() if k not in RESULTS_STORE_FIELDS]
+    columns['extra_fields'] = pa.array([extra_fields], type=pa.map_(pa.string(), pa.string()))
+    table = pa.table(columns)
+
+    buf = pa.BufferOutputStream()
+    pq.write_table(table, buf, compression='zstd')
+
+    dt = item['processing_timestamp'][:10]
+    case_id = item['case_id'] or '0000000'
+    partition = f"{RESULTS_STORE_PREFIX}documents/dt={dt}/case_id={case_id}/"
+    get_client('s3').put_object(
+        Bucket=RESULTS_BUCKET,
+        Key=f"{partition}{item['document_id']}.parquet",
+        Body=buf.getvalue().to_pybytes(),
+        ContentType="application/vnd.apache.parquet",
+    )
+    return f"s3://{RESULTS_BUCKET}/{partition}"
+
+
 def extract_case_id_from_key(key):
     """
     Expected pattern:
@@ -343,7 +815,7 @@ def wait_for_bda(invocation_arn):
     print("Starting TRACK BDA")
 
     for _ in range(MAX_POLLS):
-        resp = bda_client.get_data_automation_status(
+        resp = get_client('bedrock-data-automation-runtime', BEDROCK_REGION).get_data_automation_status(
             invocationArn=invocation_arn
         )
         state = resp["status"]
@@ -356,6 +828,37 @@ def wait_for_bda(invocation_arn):
         f"BDA dont finish in {MAX_POLLS * POLL_INTERVAL}s"
     )
 
+def wait_for_bda_batch(invocation_arns, deadline=None):
+    """
+    Poll several BDA invocations in the same loop.
+    Invocations still running after MAX_POLLS, or when the Lambda deadline
+    is near, are reported with status "Timeout".
+    """
+    results = {}
+    pending = list(invocation_arns)
+
+    for _ in range(MAX_POLLS):
+        for invocation_arn in list(pending):
+            resp = get_client('bedrock-data-automation-runtime', BEDROCK_REGION).get_data_automation_status(
+                invocationArn=invocation_arn
+            )
+            if resp["status"] in ("Success", "ClientError", "ServiceError"):
+                results[invocation_arn] = resp
+                pending.remove(invocation_arn)
+        logger.info(f"BDA batch: {len(results)} finished, {len(pending)} pending")
+        if not pending:
+            return results
+        if deadline is not None and time.monotonic() + POLL_INTERVAL > deadline:
+            break
+        time.sleep(POLL_INTERVAL)
+
+    for invocation_arn in pending:
+        results[invocation_arn] = {
+            "status": "Timeout",
+            "errorMessage": f"BDA dont finish in {MAX_POLLS * POLL_INTERVAL}s",
+        }
+    return results
+
 def fetch_results(metadata_s3_uri, document_id):
     """
     Download the Bedrock metadata JSON, extract every custom_output_path,
@@ -363,7 +866,7 @@ def fetch_results(metadata_s3_uri, document_id):
     """
     # 1. download the metadata file
     parsed = urlparse(metadata_s3_uri)
-    meta_obj = s3_client.get_object(
+    meta_obj = get_client('s3').get_object(
         Bucket=parsed.netloc,
         Key=parsed.path.lstrip("/")
     )
@@ -386,7 +889,7 @@ def fetch_results(metadata_s3_uri, document_id):
 
         for src_uri in standard_paths:
             parsed = urlparse(src_uri)
-            meta_obj = s3_client.get_object(
+            meta_obj = get_client('s3').get_object(
                 Bucket=parsed.netloc,
                 Key=parsed.path.lstrip("/")
             )
@@ -402,7 +905,7 @@ def fetch_results(metadata_s3_uri, document_id):
     for src_uri in custom_paths:
         # 3. copy every result file into RESULTS_BUCKET
         parsed = urlparse(src_uri)
-        meta_obj = s3_client.get_object(
+        meta_obj = get_client('s3').get_object(
             Bucket=parsed.netloc,
             Key=parsed.path.lstrip("/")
         )
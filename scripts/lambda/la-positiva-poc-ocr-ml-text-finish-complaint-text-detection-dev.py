@@ -1,8 +1,10 @@
 import boto3
-import time, io, os, json
+import time, io, os, json, threading, unicodedata
 from collections import defaultdict
-from PyPDF2 import PdfReader, PdfWriter
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import lru_cache
+from botocore.config import Config
 from boto3.dynamodb.conditions import Key
 from decimal import Decimal
 
@@ -12,6 +14,8 @@ TARGET_PREFIX = os.environ['TARGET_PREFIX']
 TARGET_ALL_WORDS_PREFIX = os.environ['TARGET_ALL_WORDS_PREFIX']
 PROCESSED_PREFIX = os.environ['PROCESSED_PREFIX']
 DYNAMO_TABLE = os.environ['DYNAMO_TABLE']
+# Columnar results store (Parquet in BUCKET, disabled when empty). Needs pyarrow.
+RESULTS_STORE_PREFIX = os.environ.get('RESULTS_STORE_PREFIX', '')
 
 KEYWORDS = {
     "telefono", "licipante", "fallecido", "denunciante", "raviado", "tipificacion", "lugar del hecho", "participante",
@@ -21,14 +25,89 @@ KEYWORDS = {
 }
 MIN_HITS = 3
 
-dynamodb = boto3.resource('dynamodb')
-ddb_table = dynamodb.Table(DYNAMO_TABLE)
-s3 = boto3.client('s3')
-textract = boto3.client('textract')
+# OCR-tolerant matching: every page is indexed once by character trigrams, all
+# keywords are scored against that index, and only the keywords sharing enough
+# trigrams are located and confirmed with a bounded edit distance
+FUZZY_KEYWORD_MATCHING = os.environ.get('FUZZY_KEYWORD_MATCHING', 'true').lower() == 'true'
+NGRAM_SIZE = 3
+
+# Hand-added OCR fragments in KEYWORDS and the keyword each one stands for.
+# The fuzzy matcher counts a keyword once when it, or one of its fragments
+# matched exactly, is found: fragments catch damage beyond the edit budget.
+OCR_FRAGMENTS = {
+    "licipante": "participante", "raviado": "agraviado",
+    "tentificador": "autentificador", "viniente": "interviniente",
+}
+# keyword -> its exact-match fragments
+FUZZY_KEYWORDS = {kw: [] for kw in KEYWORDS if kw not in OCR_FRAGMENTS}
+for _fragment, _kw in OCR_FRAGMENTS.items():
+    FUZZY_KEYWORDS.setdefault(_kw, []).append(_fragment)
+
+
+def _max_edits(keyword):
+    # short keywords ("pnp", "regpol", "citado") are matched exactly
+    if len(keyword) < 7:
+        return 0
+    return 1 if len(keyword) < 11 else 2
+
+
+def _ngrams(text, n=NGRAM_SIZE):
+    # character tuples hash faster than sliced strings
+    return zip(*(text[i:] for i in range(n)))
+
+
+def _keyword_plan(keyword):
+    """
+    (max edits, trigrams, minimum trigrams shared with the page, pieces).
+    Each edit destroys at most NGRAM_SIZE trigrams and leaves at least one of
+    the max_edits + 1 pieces (offset, substring) intact.
+    """
+    k = _max_edits(keyword)
+    grams = list(_ngrams(keyword))
+    step = len(keyword) // (k + 1)
+    pieces = [(i * step, keyword[i * step:(i + 1) * step if i < k else None]) for i in range(k + 1)]
+    return k, grams, len(grams) - k * NGRAM_SIZE, pieces
+
+
+_KEYWORD_PLANS = {kw: _keyword_plan(kw) for kw in FUZZY_KEYWORDS}
+
+
+def _normalize_text(text):
+    # lowercase, drop accents (OCR output mixes "policía" / "policia") and collapse whitespace
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.split())
+
+# AWS clients are built lazily on first use and reused across warm invocations
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '10')),
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    connect_timeout=5,
+    read_timeout=60,
+)
+_clients_lock = threading.Lock()  # boto3 session creation is not thread-safe
+
+@lru_cache(maxsize=None)
+def get_client(service_name):
+    with _clients_lock:
+        return boto3.client(service_name, config=BOTO_CONFIG)
+
+@lru_cache(maxsize=1)
+def get_ddb_table():
+    with _clients_lock:
+        return boto3.resource('dynamodb', config=BOTO_CONFIG).Table(DYNAMO_TABLE)
+
+# Per-record I/O pipeline, sized to stay within the botocore connection pool
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', '4'))
+
+@lru_cache(maxsize=1)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=PIPELINE_WORKERS)
 
 
 def get_pending_jobs():
-    response = ddb_table.query(
+    response = get_ddb_table().query(
         IndexName="status-timestamp-index",
         KeyConditionExpression=Key("status").eq("IN_PROGRESS"),
         ScanIndexForward=True  # Sort ascending (oldest first)
@@ -37,9 +116,74 @@ def get_pending_jobs():
     return response.get("Items", [])
 
 def check_textract_results(job_id):
-    return textract.get_document_text_detection(JobId=job_id)
+    return get_client('textract').get_document_text_detection(JobId=job_id)
+
+def build_ngram_index(text):
+    return set(_ngrams(text))
+
+def _within_edit_distance(pattern, text, max_edits):
+    """
+    True if pattern matches some substring of text with at most max_edits
+    insertions/deletions/substitutions (Sellers' semi-global alignment).
+    """
+    prev = [0] * (len(text) + 1)
+    for i, p_ch in enumerate(pattern, 1):
+        curr = [i] + [0] * len(text)
+        for j, t_ch in enumerate(text, 1):
+            curr[j] = min(prev[j - 1] + (p_ch != t_ch), prev[j] + 1, curr[j - 1] + 1)
+        if min(curr) > max_edits:
+            return False
+        prev = curr
+    return min(prev) <= max_edits
+
+def _keyword_in_page(keyword, text, index):
+    if keyword in text:
+        return True
+    max_edits, grams, min_shared, pieces = _KEYWORD_PLANS[keyword]
+    if max_edits == 0:
+        return False
+    if sum(1 for gram in grams if gram in index) < min_shared:
+        return False
+
+    # Only the alignments implied by an intact piece are verified, and only
+    # when the window around them also shares enough trigrams
+    checked = set()
+    for offset, piece in pieces:
+        pos = text.find(piece)
+        while pos != -1:
+            start = pos - offset
+            if start not in checked:
+                checked.add(start)
+                window = text[max(start - max_edits, 0):start + len(keyword) + 2 * max_edits]
+                window_index = build_ngram_index(window)
+                if (sum(1 for gram in grams if gram in window_index) >= min_shared
+                        and _within_edit_distance(keyword, window, max_edits)):
+                    return True
+            pos = text.find(piece, pos + 1)
+    return False
+
+def count_keyword_hits_exact(combined):
+    return sum(1 for kw in KEYWORDS if kw in combined)
+
+def count_keyword_hits_fuzzy(combined):
+    text = _normalize_text(combined)
+    index = build_ngram_index(text)
+    return sum(
+        1 for kw, fragments in FUZZY_KEYWORDS.items()
+        if any(fragment in text for fragment in fragments) or _keyword_in_page(kw, text, index)
+    )
 
-def extract_pages_with_keywords(job_result):
+def count_keyword_hits(combined):
+    if FUZZY_KEYWORD_MATCHING:
+        return count_keyword_hits_fuzzy(combined)
+    return count_keyword_hits_exact(combined)
+
+def extract_pages_with_keywords(job_result, page_hits=None):
+    """
+    page_hits: keyword hits already counted per page while the blocks were
+    streamed; pages missing from it (or None) are counted here.
+    """
+    page_hits = page_hits if page_hits is not None else {}
     pages = defaultdict(list)
     confidences = defaultdict(list)
     for block in job_result.get("Blocks", []):
@@ -53,8 +197,9 @@ def extract_pages_with_keywords(job_result):
     matched_conf = {}
 
     for page_num, lines in pages.items():
-        combined = " ".join(lines).lower()
-        hits = sum(1 for kw in KEYWORDS if kw in combined)
+        hits = page_hits.get(page_num)
+        if hits is None:
+            hits = count_keyword_hits(" ".join(lines).lower())
         if hits >= MIN_HITS:
             matched.append((page_num, hits, lines))
             # Only now calculate average confidence
@@ -65,14 +210,21 @@ def extract_pages_with_keywords(job_result):
 
     return matched, matched_conf
 
-def save_filtered_output(s3_key, matches, job_id):
-    ext = s3_key.rsplit(".", 1)[-1].lower()
-    original_key = s3_key  # file is still in source/
+def read_source_object(s3_key):
+    obj = get_client('s3').get_object(Bucket=BUCKET, Key=s3_key)  # file is still in source/
+    return obj["Body"].read()
 
-    obj = s3.get_object(Bucket=BUCKET, Key=original_key)
-    body = obj["Body"].read()
+def build_filtered_outputs(s3_key, matches, job_id, body):
+    """
+    Build the filtered document and the matched-text .txt.
+    Returns a list of (key, content, content_type) ready to upload.
+    """
+    ext = s3_key.rsplit(".", 1)[-1].lower()
 
     if ext == "pdf":
+        # PyPDF2 is only needed when a filtered PDF is written
+        from PyPDF2 import PdfReader, PdfWriter
+
         print("Before reading file")
         reader = PdfReader(io.BytesIO(body))
         writer = PdfWriter()
@@ -93,39 +245,83 @@ def save_filtered_output(s3_key, matches, job_id):
         #out_key = f"{TARGET_PREFIX}{os.path.basename(original_key).rsplit('.', 1)[0]}_keywords.{ext}"
         out_key = f"{TARGET_PREFIX}{s3_key[len(SOURCE_PREFIX):].rsplit('.', 1)[0]}_keywords.{ext}"
 
-    print(f"[INFO] Uploading filtered: s3://{BUCKET}/{out_key}")
-    s3.put_object(
-        Bucket=BUCKET,
-        Key=out_key,
-        Body=content,
-        ContentType=content_type,
-        Metadata={
-            #"source": original_key,
-            "keywords": ",".join(sorted(KEYWORDS))
-        },
-    )
-    print(f"[INFO] Uploaded filtered: s3://{BUCKET}/{out_key}")
-
     # === NEW SECTION: Upload .txt with matched words ===
     lines_txt = []
     for _, _, lines in sorted(matches):
         lines_txt.extend(lines)
 
-    txt_content = "\n".join(lines_txt)
-    txt_buf = io.BytesIO(txt_content.encode("utf-8"))
+    txt_content = "\n".join(lines_txt).encode("utf-8")
     txt_key = f"{TARGET_ALL_WORDS_PREFIX}{s3_key[len(SOURCE_PREFIX):].rsplit('.', 1)[0]}_textract_id_{job_id}_all_words.txt"
 
-    s3.put_object(
+    return [(out_key, content, content_type), (txt_key, txt_content, "text/plain")]
+
+def upload_output(key, content, content_type):
+    print(f"[INFO] Uploading: s3://{BUCKET}/{key}")
+    get_client('s3').put_object(
         Bucket=BUCKET,
-        Key=txt_key,
-        Body=txt_buf,
-        ContentType="text/plain",
+        Key=key,
+        Body=content,
+        ContentType=content_type,
         Metadata={
             #"source": original_key,
             "keywords": ",".join(sorted(KEYWORDS)),
         },
     )
-    print(f"[INFO] Uploaded matched text: s3://{BUCKET}/{txt_key}")
+    print(f"[INFO] Uploaded: s3://{BUCKET}/{key}")
+
+def write_results_store(job_id, s3_key, status, page_conf, failed_reason=None):
+    """
+    Write the job's status and page confidences as a zstd Parquet file
+    partitioned by date:
+      <RESULTS_STORE_PREFIX>textract_jobs/dt=<YYYY-MM-DD>/<job_id>.parquet
+    Small files are merged per partition by compact_results_store.py, so the
+    partition URI is returned rather than the file's.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    processed_at = datetime.utcnow().isoformat()
+    confidences = [
+        {"page": int(page), "confidence": float(conf)}
+        for page, conf in sorted(page_conf.items(), key=lambda kv: int(kv[0]))
+    ]
+    table = pa.table({
+        "job_id": [job_id],
+        "s3_key": [s3_key],
+        "status": [status],
+        "processed_at": [processed_at],
+        "failed_reason": pa.array([failed_reason], type=pa.string()),
+        "matched_pages": pa.array([len(confidences)], type=pa.int32()),
+        "page_confidence": pa.array(
+            [confidences],
+            type=pa.list_(pa.struct([("page", pa.int32()), ("confidence", pa.float64())])),
+        ),
+    })
+
+    buf = pa.BufferOutputStream()
+    pq.write_table(table, buf, compression="zstd")
+
+    partition = f"{RESULTS_STORE_PREFIX}textract_jobs/dt={processed_at[:10]}/"
+    get_client('s3').put_object(
+        Bucket=BUCKET,
+        Key=f"{partition}{job_id}.parquet",
+        Body=buf.getvalue().to_pybytes(),
+        ContentType="application/vnd.apache.parquet",
+    )
+    return f"s3://{BUCKET}/{partition}"
+
+def failed_job_attrs(job_id, s3_key, failed_reason=None):
+    """
+    Record a FAILED job in the results store (when enabled) and return the
+    extra DynamoDB attributes for it.
+    """
+    extra_attrs = {"failed_reason": failed_reason} if failed_reason else {}
+    if RESULTS_STORE_PREFIX:
+        try:
+            extra_attrs["results_store_uri"] = write_results_store(job_id, s3_key, "FAILED", {}, failed_reason)
+        except Exception as e:
+            print(f"[WARN] Failed writing results store for {job_id}: {e}")
+    return extra_attrs
 
 def update_job_status(job_id, new_status, extra_attrs=None):
     update_expr = "SET #st = :new, updated = :now"
@@ -141,20 +337,123 @@ def update_job_status(job_id, new_status, extra_attrs=None):
             update_expr += f", {k} = {placeholder}"
             expr_attr_vals[placeholder] = v
 
-    ddb_table.update_item(
+    get_ddb_table().update_item(
         Key={"job_id": job_id},
         UpdateExpression=update_expr,
         ExpressionAttributeNames=expr_attr_names,
         ExpressionAttributeValues=expr_attr_vals
     )
 
-def move_s3_object(source_key):
+def copy_to_processed(source_key):
     #new_key = source_key.replace(SOURCE_PREFIX, PROCESSED_PREFIX, 1)
     suffix_path = source_key[len(SOURCE_PREFIX):]
     new_key = f"{PROCESSED_PREFIX}{suffix_path}"
-    s3.copy_object(Bucket=BUCKET, CopySource={"Bucket": BUCKET, "Key": source_key}, Key=new_key)
-    s3.delete_object(Bucket=BUCKET, Key=source_key)
-    print(f"[INFO] Moved to processed: {new_key}")
+    get_client('s3').copy_object(Bucket=BUCKET, CopySource={"Bucket": BUCKET, "Key": source_key}, Key=new_key)
+    print(f"[INFO] Copied to processed: {new_key}")
+
+def iter_textract_pages(job_id, executor):
+    """
+    Yield the GetDocumentTextDetection responses of a job, requesting the
+    next page in the background while the current one is consumed.
+    """
+    resp = check_textract_results(job_id)
+    while True:
+        next_token = resp.get("NextToken")
+        next_page = (
+            executor.submit(get_client('textract').get_document_text_detection, JobId=job_id, NextToken=next_token)
+            if next_token else None
+        )
+        yield resp
+        if next_page is None:
+            return
+        resp = next_page.result()
+
+def _wait_all(futures):
+    # Let every step finish before surfacing the first error
+    wait(futures)
+    return [future.result() for future in futures]
+
+def process_succeeded_job(job_id, s3_key, from_zip):
+    """
+    Per-record I/O pipeline. The source GET is started as soon as the first
+    page with MIN_HITS keywords comes out of the Textract pagination, so jobs
+    without matches never download the file. The filtered PDF / txt uploads
+    and the copy to processed run concurrently; the results store write is
+    only made once they all succeeded and overlaps the delete of the source.
+    Returns (page_conf, page_count, store_uri, output_keys).
+    """
+    executor = get_executor()
+    source = {}
+
+    def start_source_read():
+        if "body" not in source:
+            source["body"] = executor.submit(read_source_object, s3_key)
+
+    document_metadata = {}
+    page_hits = {}
+
+    def count_page(page_num, page_lines):
+        if page_num in page_hits:
+            # Page split across the stream: let the matching pass count it whole
+            page_hits[page_num] = None
+            return
+        page_hits[page_num] = count_keyword_hits(" ".join(page_lines).lower())
+        if page_hits[page_num] >= MIN_HITS:
+            start_source_read()
+
+    def blocks():
+        # Pages come in order: each one is counted once, as it completes
+        page_num, page_lines = None, []
+        for resp in iter_textract_pages(job_id, executor):
+            document_metadata.update(resp.get("DocumentMetadata", {}))
+            for block in resp["Blocks"]:
+                if block["BlockType"] == "LINE":
+                    if block["Page"] != page_num:
+                        if page_lines:
+                            count_page(page_num, page_lines)
+                        page_num, page_lines = block["Page"], []
+                    page_lines.append(block["Text"])
+                yield block
+        if page_lines:
+            count_page(page_num, page_lines)
+
+    print('Before extracting page with keywords')
+    matched, page_conf = extract_pages_with_keywords({"Blocks": blocks()}, page_hits)
+
+    steps = []
+    output_keys = {}
+    if matched:
+        start_source_read()
+        outputs = build_filtered_outputs(s3_key, matched, job_id, source["body"].result())
+        output_keys = {"filtered_key": outputs[0][0], "txt_key": outputs[1][0]}
+        for key, content, content_type in outputs:
+            steps.append(executor.submit(upload_output, key, content, content_type))
+    if not from_zip:
+        print('Before moving to proccesed')
+        steps.append(executor.submit(copy_to_processed, s3_key))
+
+    _wait_all(steps)
+
+    # Outputs are in place: record PROCESSED while the source is deleted
+    store_future = None
+    if RESULTS_STORE_PREFIX:
+        store_future = executor.submit(write_results_store, job_id, s3_key, "PROCESSED", page_conf)
+
+    # Clean up or move
+    get_client('s3').delete_object(Bucket=BUCKET, Key=s3_key)
+    if from_zip:
+        print(f"[INFO] Deleted temp extracted file: {s3_key}")
+    else:
+        print(f"[INFO] Deleted source after copy to processed: {s3_key}")
+
+    store_uri = None
+    if store_future is not None:
+        try:
+            store_uri = store_future.result()
+        except Exception as e:
+            print(f"[WARN] Failed writing results store for {job_id}: {e}")
+
+    return page_conf, document_metadata.get("Pages", 0), store_uri, output_keys
 
 def is_temp_extracted_from_zip(s3_key):
     return s3_key.startswith(f"{SOURCE_PREFIX}unzipped/")
@@ -184,47 +483,31 @@ def lambda_handler(event, context):
             print(f"S3 Key: {s3_key}")
 
             try:
-                result = check_textract_results(job_id)
                 if status == "SUCCEEDED":
-                    pages = []
-                    next_token = None
-                    while True:
-                        resp = (
-                            textract.get_document_text_detection(JobId=job_id, NextToken=next_token)
-                            if next_token else result
-                        )
-                        pages.extend(resp["Blocks"])
-                        next_token = resp.get("NextToken")
-                        if not next_token:
-                            break
-                    print('Before extracting page with keywords')
-                    matched, page_conf = extract_pages_with_keywords({"Blocks": pages})
-                    if matched:
-                        save_filtered_output(s3_key, matched, job_id)
-
-                    # Clean up or move
-                    if from_zip:
-                        s3.delete_object(Bucket=BUCKET, Key=s3_key)
-                        print(f"[INFO] Deleted temp extracted file: {s3_key}")
-                    else:
-                        print('Before moving to proccesed')
-                        move_s3_object(s3_key)
+                    page_conf, page_count, store_uri, output_keys = process_succeeded_job(job_id, s3_key, from_zip)
+
+                    # Page confidences go to the columnar store when enabled
+                    extra_attrs = {"results_store_uri": store_uri} if store_uri else {"page_confidence": page_conf}
+                    extra_attrs["page_count"] = page_count
+                    # Lets duplicates of this document point at its outputs
+                    extra_attrs.update(output_keys)
 
+                    # Status is committed only after every step of the record succeeded
                     update_job_status(
                         job_id,
                         "PROCESSED",
-                        extra_attrs={"page_confidence": page_conf}
+                        extra_attrs=extra_attrs
                     )
 
                 elif status == "FAILED":
-                    update_job_status(job_id, "FAILED")
+                    update_job_status(job_id, "FAILED", extra_attrs=failed_job_attrs(job_id, s3_key))
 
             except Exception as e:
                 print(f"[ERROR] Failed processing {job_id}: {e}")
                 update_job_status(
                     job_id,
                     "FAILED",
-                    extra_attrs={"failed_reason": str(e)}
+                    extra_attrs=failed_job_attrs(job_id, s3_key, str(e))
                 )
 
         except json.JSONDecodeError as e: